@@ -47,9 +47,12 @@ info "OS: $(cat /etc/os-release | grep PRETTY_NAME | cut -d= -f2 | tr -d '\"')"
 info "Kernel: $(uname -r)"
 info "Architecture: $(uname -m)"
 
+# Query both services up front; is-active prints one state per line
+{ read -r WIFI_CONNECT_STATE; read -r NM_STATE; } < <(systemctl is-active wifi-connect NetworkManager 2>/dev/null)
+
 echo ""
 debug "=== WiFi Connect Service Status ==="
-if systemctl is-active --quiet wifi-connect; then
+if [ "$WIFI_CONNECT_STATE" = "active" ]; then
     info "WiFi Connect service is running"
 else
     error "WiFi Connect service is not running"
@@ -77,7 +80,7 @@ fi
 
 echo ""
 debug "=== NetworkManager Status ==="
-if systemctl is-active --quiet NetworkManager; then
+if [ "$NM_STATE" = "active" ]; then
     info "NetworkManager is running"
     if command -v nmcli >/dev/null 2>&1; then
         nmcli device status | head -10
@@ -108,7 +111,7 @@ fi
 
 echo ""
 debug "=== Test WiFi Connect Endpoints ==="
-if systemctl is-active --quiet wifi-connect; then
+if [ "$WIFI_CONNECT_STATE" = "active" ]; then
     info "Testing /networks endpoint..."
     curl -s http://localhost/networks | head -200 || error "Failed to reach /networks"
 
@@ -456,9 +456,8 @@ EOF
     # Step 6: Enable and restart services
     log "Enabling and restarting services..."
     # Note: wifi-connect is NOT enabled - managed by wifi-connect-manager
-    systemctl enable wifi-connect-manager.service >> "$LOG_FILE" 2>&1
-    systemctl enable ossuary-startup.service >> "$LOG_FILE" 2>&1
-    systemctl enable ossuary-web.service >> "$LOG_FILE" 2>&1
+    systemctl enable wifi-connect-manager.service ossuary-startup.service \
+        ossuary-web.service >> "$LOG_FILE" 2>&1
 
     # Restart services (don't fail if services don't start immediately)
     log "Starting all services..."
@@ -5,16 +5,19 @@ Runs on port 8080 to provide persistent configuration interface
 Compatible with Python 3.9+ (Pi OS Bullseye through Trixie)
 """
 
+import contextlib
+import gzip
 import json
 import os
 import subprocess
 import sys
 import time
 import signal
-import threading
+import socket
 import tempfile
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlparse
 
 # Check Python version
 if sys.version_info < (3, 7):
@@ -23,20 +26,168 @@ if sys.version_info < (3, 7):
 
 CONFIG_FILE = "/etc/ossuary/config.json"
 UI_DIR = "/opt/ossuary/custom-ui"
-LOG_DIR = "/var/log"
+PROCESS_PID_FILE = "/run/ossuary/process.pid"
+PROCESS_LOG_FILE = "/var/log/ossuary-process.log"
 TEST_PROCESSES = {}  # Track test processes
+MANAGED_SERVICES = ('wifi-connect', 'wifi-connect-manager', 'ossuary-startup', 'ossuary-web')
+VALID_SERVICES = frozenset(MANAGED_SERVICES)
+VALID_ACTIONS = frozenset(('start', 'stop', 'restart'))
+STATUS_CACHE_TTL = 2  # Seconds to reuse a status probe across polling clients
+# Each cache holds one (stamp, value) tuple so request threads never see a
+# stamp paired with another entry's value
+STATUS_CACHE = {'entry': None}
+STATUS_LOCK = threading.Lock()  # One status probe at a time; waiters reuse it
+CONFIG_CACHE = {'entry': None}
+GZIP_MIN_SIZE = 512  # Smaller JSON bodies are not worth compressing
+ACCESS_LOG = False  # Log every request, not just failures (--access-log)
+
+def remove_file(path):
+    """Delete a file, ignoring it if it is already gone"""
+    with contextlib.suppress(OSError):
+        os.unlink(path)
+
+def invalidate_status_cache():
+    """Force the next status request to probe the system again"""
+    STATUS_CACHE['entry'] = None
+
+def cached_status():
+    """Return the cached status if it is still fresh, else None"""
+    entry = STATUS_CACHE['entry']
+    if entry is not None and time.monotonic() - entry[0] < STATUS_CACHE_TTL:
+        return entry[1]
+    return None
+
+def tail_file(path, lines, block_size=8192):
+    """Return the last lines of a file, reading backwards only as far as needed"""
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b''
+        while end > 0 and data.count(b'\n') <= lines:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+
+    # A trailing newline leaves an empty last piece that isn't a line
+    keep = lines + 1 if data.endswith(b'\n') else lines
+    return b'\n'.join(data.split(b'\n')[-keep:]).decode('utf-8', errors='replace')
+
+def accepts_gzip(header):
+    """Whether an Accept-Encoding header allows gzip; q=0 means refused"""
+    qvalues = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+
+    # An explicit gzip entry takes precedence over the * wildcard
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+def start_probe(cmd):
+    """Launch a status probe without waiting for it; None if it can't run"""
+    try:
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+
+def probe_output(proc, timeout=2):
+    """Collect a started probe's output, or '' if it failed or timed out"""
+    if proc is None:
+        return ''
+    try:
+        return proc.communicate(timeout=timeout)[0].strip()
+    except subprocess.TimeoutExpired:
+        # Only wait on the process itself; a grandchild may still hold the pipe
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        return ''
+
+def load_config():
+    """Return the parsed config file, re-reading it only when it changes on disk"""
+    try:
+        st = os.stat(CONFIG_FILE)
+    except FileNotFoundError:
+        return {}
+
+    # Size catches rewrites that land within the filesystem's mtime granularity
+    key = (st.st_mtime_ns, st.st_size)
+    entry = CONFIG_CACHE['entry']
+    if entry is None or entry[0] != key:
+        # json detects UTF-8 in bytes, so skip the text decoding layer
+        with open(CONFIG_FILE, 'rb') as f:
+            entry = (key, json.loads(f.read()))
+        CONFIG_CACHE['entry'] = entry
+
+    return entry[1]
+
+def save_config(config):
+    """Atomically replace the config file; returns False if it was already up to date"""
+    if config == load_config():
+        return False
+
+    # Write beside the real file and rename over it, so readers never see a
+    # truncated config if the write is interrupted
+    config_dir = os.path.dirname(CONFIG_FILE)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=config_dir, prefix='.config-', suffix='.json')
+    except FileNotFoundError:
+        # The installer creates the directory, so this only happens once
+        os.makedirs(config_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=config_dir, prefix='.config-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            os.fchmod(f.fileno(), 0o644)
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, CONFIG_FILE)
+    except BaseException:
+        remove_file(tmp_path)
+        raise
+    return True
 
 class ConfigHandler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=UI_DIR, **kwargs)
 
+    def log_request(self, code='-', size='-'):
+        """Skip successful requests unless access logging is enabled"""
+        # The UI polls status every few seconds, which would flood the journal
+        if ACCESS_LOG or (isinstance(code, int) and code >= 400):
+            super().log_request(code, size)
+
+    def copyfile(self, source, outputfile):
+        """Send static files with sendfile(2) instead of copying through Python"""
+        self.connection.sendfile(source)
+
     def send_json_response(self, data, status=200):
         """Helper to send JSON responses"""
+        body = json.dumps(data, separators=(',', ':')).encode()
+        # Log tails can be several KB, which is slow over the AP's WiFi link
+        compress = (len(body) >= GZIP_MIN_SIZE and
+                    accepts_gzip(self.headers.get('Accept-Encoding', '')))
+        if compress:
+            body = gzip.compress(body)
+
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
 
     def do_GET(self):
         parsed_path = urlparse(self.path)
@@ -109,30 +260,33 @@ class ConfigHandler(SimpleHTTPRequestHandler):
 
     def handle_status(self):
         """Get system status"""
+        # control-panel.html polls /api/status every 5s (index.html polls the
+        # legacy /status route, also served here), so reuse a recent probe
+        status = cached_status()
+        if status is not None:
+            self.send_json_response(status)
+            return
+
         try:
-            # Check WiFi status
-            try:
-                result = subprocess.run(['iwgetid', '-r'], capture_output=True, text=True, timeout=2)
-                ssid = result.stdout.strip()
-                wifi_connected = bool(ssid)
-            except:
-                wifi_connected = False
-                ssid = ""
-
-            # Check if in AP mode
-            try:
-                result = subprocess.run(['systemctl', 'is-active', 'wifi-connect'],
-                                      capture_output=True, text=True, timeout=2)
-                ap_mode = result.stdout.strip() == 'active'
-            except:
-                ap_mode = False
-
-            status = {
-                'wifi_connected': wifi_connected,
-                'ssid': ssid,
-                'ap_mode': ap_mode,
-                'hostname': subprocess.run(['hostname'], capture_output=True, text=True).stdout.strip()
-            }
+            with STATUS_LOCK:
+                # Requests that missed the cache together share one probe
+                status = cached_status()
+                if status is None:
+                    # Start both probes before waiting on either so they overlap
+                    wifi_probe = start_probe(['iwgetid', '-r'])
+                    ap_probe = start_probe(['systemctl', 'is-active', 'wifi-connect'])
+
+                    ssid = probe_output(wifi_probe)
+                    ap_mode = probe_output(ap_probe) == 'active'
+
+                    status = {
+                        'wifi_connected': bool(ssid),
+                        'ssid': ssid,
+                        'ap_mode': ap_mode,
+                        'hostname': socket.gethostname()
+                    }
+
+                    STATUS_CACHE['entry'] = (time.monotonic(), status)
 
             self.send_json_response(status)
         except Exception as e:
@@ -141,14 +295,10 @@ class ConfigHandler(SimpleHTTPRequestHandler):
     def handle_get_startup(self):
         """Get current startup command"""
         try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r') as f:
-                    config = json.load(f)
-                    self.send_json_response({
-                        'command': config.get('startup_command', '')
-                    })
-            else:
-                self.send_json_response({'command': ''})
+            config = load_config()
+            self.send_json_response({
+                'command': config.get('startup_command', '')
+            })
         except Exception as e:
             self.send_json_response({'error': str(e)}, 500)
 
@@ -158,39 +308,34 @@ class ConfigHandler(SimpleHTTPRequestHandler):
             data = json.loads(post_data)
             command = data.get('command', '')
 
-            # Load existing config or create new
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r') as f:
-                    config = json.load(f)
-            else:
-                config = {}
+            # Copy so the cached config is untouched if the write fails
+            config = dict(load_config())
 
             # Update command
             config['startup_command'] = command
 
-            # Save config
-            os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=2)
+            # Save config; only a changed command is worth a HUP, since the
+            # process manager answers it by stopping the running command and
+            # starting the one now in the config
+            service_reloaded = False
+            if save_config(config):
+                try:
+                    with open(PROCESS_PID_FILE, 'r') as f:
+                        pid = int(f.read().strip())
+                        os.kill(pid, signal.SIGHUP)
+                        service_reloaded = True
+                except:
+                    pass
 
-            # Send HUP signal to process manager to reload config
-            try:
-                with open('/var/run/ossuary-process.pid', 'r') as f:
-                    pid = int(f.read().strip())
-                    os.kill(pid, signal.SIGHUP)
-                    service_reloaded = True
-            except:
-                service_reloaded = False
-
-            # Check if service is active
+            # Check if service is active; only the exit status is needed
             status_result = subprocess.run(
-                ['systemctl', 'is-active', 'ossuary-startup'],
-                capture_output=True, text=True
+                ['systemctl', 'is-active', '--quiet', 'ossuary-startup'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
             )
 
             response_data = {
                 'success': True,
-                'service_active': status_result.stdout.strip() == 'active',
+                'service_active': status_result.returncode == 0,
                 'config_reloaded': service_reloaded
             }
 
@@ -201,13 +346,12 @@ class ConfigHandler(SimpleHTTPRequestHandler):
     def handle_get_services(self):
         """Get service status"""
         try:
-            services = {}
-            for service in ['wifi-connect', 'wifi-connect-manager', 'ossuary-startup', 'ossuary-web']:
-                result = subprocess.run(
-                    ['systemctl', 'is-active', service],
-                    capture_output=True, text=True, timeout=2
-                )
-                services[service] = result.stdout.strip()
+            # One call answers for every unit, one state per line in order
+            result = subprocess.run(
+                ['systemctl', 'is-active', *MANAGED_SERVICES],
+                capture_output=True, text=True, timeout=2
+            )
+            services = dict(zip(MANAGED_SERVICES, result.stdout.split()))
 
             self.send_json_response(services)
         except Exception as e:
@@ -220,23 +364,19 @@ class ConfigHandler(SimpleHTTPRequestHandler):
 
             # Try to get NetworkManager connection profiles
             try:
+                # TYPE comes first so a name containing ':' (escaped as '\:'
+                # in terse mode) stays in one piece after a single partition
                 result = subprocess.run(
-                    ['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'],
+                    ['nmcli', '-t', '-f', 'TYPE,NAME', 'connection', 'show'],
                     capture_output=True, text=True, timeout=5
                 )
 
                 if result.returncode == 0:
-                    lines = result.stdout.strip().split('\n')
-                    for line in lines:
-                        if line and ':' in line:
-                            parts = line.split(':')
-                            if len(parts) >= 2 and parts[1] == '802-11-wireless':
-                                network_name = parts[0]
-                                saved_networks.append({
-                                    'ssid': network_name,
-                                    'saved': True,
-                                    'type': 'wifi'
-                                })
+                    saved_networks = [
+                        {'ssid': name.replace('\\:', ':'), 'saved': True, 'type': 'wifi'}
+                        for conn_type, _, name in (line.partition(':') for line in result.stdout.splitlines())
+                        if conn_type == '802-11-wireless' and name
+                    ]
 
             except subprocess.TimeoutExpired:
                 pass
@@ -259,12 +399,12 @@ class ConfigHandler(SimpleHTTPRequestHandler):
             action = data.get('action')
 
             # Validate service name
-            if service not in ['wifi-connect', 'wifi-connect-manager', 'ossuary-startup', 'ossuary-web']:
+            if service not in VALID_SERVICES:
                 self.send_json_response({'error': 'Invalid service'}, 400)
                 return
 
             # Validate action
-            if action not in ['start', 'stop', 'restart']:
+            if action not in VALID_ACTIONS:
                 self.send_json_response({'error': 'Invalid action'}, 400)
                 return
 
@@ -274,6 +414,9 @@ class ConfigHandler(SimpleHTTPRequestHandler):
                 capture_output=True, text=True, timeout=10
             )
 
+            # AP mode may have changed with the service state
+            invalidate_status_cache()
+
             # Check new status
             status_result = subprocess.run(
                 ['systemctl', 'is-active', service],
@@ -296,16 +439,10 @@ class ConfigHandler(SimpleHTTPRequestHandler):
             logs = ""
 
             if log_type == 'process':
-                # Get process manager logs
-                log_file = '/var/log/ossuary-process.log'
-                if os.path.exists(log_file):
-                    # Get last 100 lines
-                    result = subprocess.run(
-                        ['tail', '-n', '100', log_file],
-                        capture_output=True, text=True, timeout=2
-                    )
-                    logs = result.stdout
-                else:
+                # Get last 100 lines of the process manager log
+                try:
+                    logs = tail_file(PROCESS_LOG_FILE, 100)
+                except FileNotFoundError:
                     logs = "No process logs available"
 
             elif log_type == 'wifi':
@@ -364,7 +501,9 @@ class ConfigHandler(SimpleHTTPRequestHandler):
                 shell=True,
                 stdout=open(output_filename, 'w'),
                 stderr=subprocess.STDOUT,
-                preexec_fn=os.setsid  # Create new process group for easy cleanup
+                # New session/process group for easy cleanup; preexec_fn
+                # isn't safe now that requests are served on threads
+                start_new_session=True
             )
 
             # Store process info
@@ -396,10 +535,11 @@ class ConfigHandler(SimpleHTTPRequestHandler):
             output_file = proc_info['output_file']
 
             # Read output
-            output = ""
-            if os.path.exists(output_file):
+            try:
                 with open(output_file, 'r') as f:
                     output = f.read()
+            except FileNotFoundError:
+                output = ""
 
             # Check if process is still running
             poll_result = process.poll()
@@ -413,11 +553,8 @@ class ConfigHandler(SimpleHTTPRequestHandler):
 
             # Clean up if process ended
             if not running:
-                try:
-                    os.unlink(output_file)
-                except:
-                    pass
-                del TEST_PROCESSES[pid_str]
+                remove_file(output_file)
+                TEST_PROCESSES.pop(pid_str, None)
 
             self.send_json_response(response)
 
@@ -437,25 +574,28 @@ class ConfigHandler(SimpleHTTPRequestHandler):
             process = proc_info['process']
             output_file = proc_info['output_file']
 
-            # Kill the process group
+            # Kill the process group, escalating if it ignores SIGTERM
             try:
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                time.sleep(1)
-                if process.poll() is None:
-                    os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-            except:
+                pgid = os.getpgid(process.pid)
+                os.killpg(pgid, signal.SIGTERM)
+                try:
+                    process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    os.killpg(pgid, signal.SIGKILL)
+            except OSError:
                 # Fallback to just killing the process
                 process.terminate()
-                time.sleep(1)
-                if process.poll() is None:
+                try:
+                    process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
                     process.kill()
 
+            # Reap the child so it doesn't linger as a zombie
+            process.wait()
+
             # Clean up
-            try:
-                os.unlink(output_file)
-            except:
-                pass
-            del TEST_PROCESSES[pid_str]
+            remove_file(output_file)
+            TEST_PROCESSES.pop(pid_str, None)
 
             self.send_json_response({'success': True})
 
@@ -473,17 +613,19 @@ class ConfigHandler(SimpleHTTPRequestHandler):
 def cleanup_test_processes():
     """Clean up any remaining test processes on exit"""
     global TEST_PROCESSES
-    for pid_str, proc_info in TEST_PROCESSES.items():
+    for proc_info in list(TEST_PROCESSES.values()):
         try:
             process = proc_info['process']
             if process.poll() is None:
                 os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-            os.unlink(proc_info['output_file'])
-        except:
+        except OSError:
             pass
+        remove_file(proc_info['output_file'])
     TEST_PROCESSES.clear()
 
 def run_server():
+    global ACCESS_LOG
+
     # Check for port argument
     port = 8080  # Default port to avoid conflict with WiFi Connect
     if len(sys.argv) > 1:
@@ -493,13 +635,16 @@ def run_server():
                     port = int(arg.split('=')[1])
                 else:
                     port = int(sys.argv[sys.argv.index(arg) + 1])
+            elif arg == '--access-log':
+                ACCESS_LOG = True
 
-    # Set up signal handlers for cleanup
-    signal.signal(signal.SIGTERM, lambda s, f: cleanup_test_processes())
-    signal.signal(signal.SIGINT, lambda s, f: cleanup_test_processes())
+    # Exit serve_forever on stop; test processes are cleaned up below
+    signal.signal(signal.SIGTERM, lambda s, f: sys.exit(0))
 
+    # Slow handlers (service restarts, nmcli) must not stall the UI's polling,
+    # so each request gets its own thread
     server_address = ('', port)
-    httpd = HTTPServer(server_address, ConfigHandler)
+    httpd = ThreadingHTTPServer(server_address, ConfigHandler)
     print(f"Enhanced config server running on port {port}...")
 
     try:
@@ -8,18 +8,49 @@ LOG_FILE="/var/log/ossuary-process.log"
 PID_FILE="/run/ossuary/process.pid"
 RESTART_DELAY=5
 
+# Command patterns, matched with the bash regex operator to avoid forking grep
+GUI_APP_PATTERN="chromium|firefox|chrome|midori|DISPLAY="
+CHROME_PATTERN="chrom(e|ium)"
+
+# Display server process names; pgrep -x anchors the whole alternation, so one
+# call covers every name
+X11_SERVERS="Xorg|X"
+WAYLAND_COMPOSITORS="wayfire|weston|sway|labwc"
+
 # Ensure log directory exists
 mkdir -p "$(dirname "$LOG_FILE")"
 
 # Function to log messages
 log() {
-    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a "$LOG_FILE"
+    # printf's %(...)T formats the time in-process instead of forking date/tee
+    local line
+    printf -v line '[%(%Y-%m-%d %H:%M:%S)T] %s' -1 "$1"
+    echo "$line"
+    echo "$line" >> "$LOG_FILE"
+}
+
+# Sleep without deferring signal handling: bash only runs traps once a
+# foreground command finishes, but a wait on a background job returns
+# as soon as a trapped signal arrives (e.g. the HUP the config server sends
+# when a different startup command is saved)
+interruptible_sleep() {
+    local sleep_pid
+    sleep "$1" &
+    sleep_pid=$!
+    wait "$sleep_pid"
+    kill "$sleep_pid" 2>/dev/null
 }
 
 # Function to get command from config
 get_command() {
     if [ -f "$CONFIG_FILE" ]; then
-        # Extract startup_command from JSON
+        # Extract startup_command from JSON; jq (installed by install.sh)
+        # starts far faster than a Python interpreter on the Pi
+        if command -v jq >/dev/null; then
+            jq -r '.startup_command // empty' "$CONFIG_FILE" 2>/dev/null
+            return
+        fi
+
         python3 -c "
 import json
 try:
@@ -54,19 +85,20 @@ detect_display_server() {
     fi
 
     # Try to detect from running processes (Pi OS 2025 specific)
-    if pgrep -x "Xorg" > /dev/null || pgrep -x "X" > /dev/null; then
+    if pgrep -x "$X11_SERVERS" > /dev/null; then
         echo "x11"
         return
     fi
 
     # Pi OS 2025 Wayland compositors
-    if pgrep -x "wayfire" > /dev/null || pgrep -x "weston" > /dev/null || pgrep -x "sway" > /dev/null || pgrep -x "labwc" > /dev/null; then
+    if pgrep -x "$WAYLAND_COMPOSITORS" > /dev/null; then
         echo "wayland"
         return
     fi
 
     # Check systemctl for display manager (modern approach)
-    if systemctl is-active --quiet gdm3 || systemctl is-active --quiet lightdm; then
+    # is-active succeeds if any of the listed units is active
+    if systemctl is-active --quiet gdm3 lightdm; then
         # If display manager is running, likely has a display server
         if [ -S "/run/user/$(id -u)/wayland-0" ] 2>/dev/null; then
             echo "wayland"
@@ -82,12 +114,15 @@ detect_display_server() {
 # Function to wait for display (for GUI apps)
 wait_for_display() {
     local max_wait=60  # Increased wait time for boot scenarios
-    local waited=0
+    local next_redetect=20
+    local start=$SECONDS
     local display_type=$(detect_display_server)
 
     log "Detected display server: $display_type"
 
-    while [ $waited -lt $max_wait ]; do
+    # Each pass can spend several seconds in the X11 probes' timeouts, so
+    # measure elapsed time rather than counting sleeps
+    while [ $((SECONDS - start)) -lt $max_wait ]; do
         # For Wayland (Pi OS 2025 default)
         if [ "$display_type" = "wayland" ]; then
             # Check for Wayland socket
@@ -96,7 +131,7 @@ wait_for_display() {
                 return 0
             fi
             # Check if any Wayland compositor is running
-            if pgrep -x "wayfire" > /dev/null || pgrep -x "weston" > /dev/null || pgrep -x "sway" > /dev/null || pgrep -x "labwc" > /dev/null; then
+            if pgrep -x "$WAYLAND_COMPOSITORS" > /dev/null; then
                 log "Wayland compositor is running"
                 return 0
             fi
@@ -126,14 +161,14 @@ wait_for_display() {
             fi
         fi
 
-        log "Waiting for display server ($display_type)... [${waited}s/${max_wait}s]"
+        log "Waiting for display server ($display_type)... [$((SECONDS - start))s/${max_wait}s]"
         sleep 2
-        waited=$((waited + 2))
 
-        # Re-detect in case it started late
-        if [ $waited -eq 20 ] || [ $waited -eq 40 ]; then
+        # Re-detect every 20 seconds in case it started late
+        if [ $((SECONDS - start)) -ge $next_redetect ]; then
             display_type=$(detect_display_server)
             log "Re-detected display server: $display_type"
+            next_redetect=$((next_redetect + 20))
         fi
     done
 
@@ -197,7 +232,7 @@ run_command() {
     log "Starting process manager for: $command"
 
     # Detect if this is a GUI application
-    if echo "$command" | grep -qE "chromium|firefox|chrome|midori|DISPLAY="; then
+    if [[ $command =~ $GUI_APP_PATTERN ]]; then
         is_gui_app=true
         log "Detected GUI application"
     fi
@@ -217,7 +252,7 @@ run_command() {
             restart_count=0
 
             # Re-detect GUI app
-            if echo "$command" | grep -qE "chromium|firefox|chrome|midori|DISPLAY="; then
+            if [[ $command =~ $GUI_APP_PATTERN ]]; then
                 is_gui_app=true
             else
                 is_gui_app=false
@@ -226,7 +261,7 @@ run_command() {
 
         if [ -z "$command" ]; then
             log "No command configured, waiting..."
-            sleep 10
+            interruptible_sleep 10
             continue
         fi
 
@@ -236,10 +271,12 @@ run_command() {
             wait_for_display
 
             # Kill existing Chrome/Chromium instances if starting Chrome
-            if echo "$command" | grep -qE "chrom(e|ium)"; then
-                log "Killing existing Chrome/Chromium instances..."
-                pkill -f "chrom(e|ium)" 2>/dev/null || true
-                sleep 2
+            if [[ $command =~ $CHROME_PATTERN ]]; then
+                # Only give the browser time to exit if something was running
+                if pkill -f "$CHROME_PATTERN" 2>/dev/null; then
+                    log "Killed existing Chrome/Chromium instances"
+                    sleep 2
+                fi
             fi
         fi
 
@@ -318,10 +355,14 @@ WRAPPER_EOF
 
         chmod +x "$wrapper_script"
 
-        # Start the wrapper script in a new session with output capture
-        setsid bash "$wrapper_script" 2>&1 | while IFS= read -r line; do
-            echo "[$(date '+%Y-%m-%d %H:%M:%S')] OUTPUT: $line" >> "$LOG_FILE"
-        done &
+        # Start the wrapper script in a new session with output capture.
+        # The logger is a process substitution rather than a pipeline stage,
+        # so $! is the setsid'd wrapper itself and its PID is the group ID
+        # stop_process kills; a pipeline's $! would be the logger, which
+        # stays in our own process group
+        setsid bash "$wrapper_script" > >(while IFS= read -r line; do
+            printf '[%(%Y-%m-%d %H:%M:%S)T] OUTPUT: %s\n' -1 "$line" >> "$LOG_FILE"
+        done) 2>&1 &
 
         CHILD_PID=$!
         echo $CHILD_PID > "${PID_FILE}.child"
@@ -330,7 +371,7 @@ WRAPPER_EOF
         sleep 2
 
         # For Chromium/Chrome, find the main browser process (not the wrapper)
-        if echo "$command" | grep -qE "chromium|chrome"; then
+        if [[ $command =~ $CHROME_PATTERN ]]; then
             # Try to find the actual Chromium process that was just started
             # Look for the newest Chromium process
             local chromium_pid=$(pgrep -n -f "$clean_command" 2>/dev/null | head -1)
@@ -361,11 +402,11 @@ WRAPPER_EOF
         # If it crashed too many times too quickly, slow down
         if [ $restart_count -gt 10 ]; then
             log "Too many restarts, waiting 30 seconds before retry..."
-            sleep 30
+            interruptible_sleep 30
             restart_count=0
         else
             log "Restarting in $RESTART_DELAY seconds..."
-            sleep $RESTART_DELAY
+            interruptible_sleep $RESTART_DELAY
         fi
     done
 }
@@ -396,9 +437,11 @@ stop_process() {
 
         # Kill the entire process group to ensure ALL children die
         # This handles cases like chromium-browser which spawns multiple processes
-        local pgid
+        # Never signal our own group: that would take the manager down too
+        local pgid own_pgid
+        own_pgid=$(ps -o pgid= -p $$ 2>/dev/null | tr -d ' ')
         if pgid=$(ps -o pgid= -p "$child_pid" 2>/dev/null | tr -d ' '); then
-            if [ -n "$pgid" ] && [ "$pgid" != "0" ]; then
+            if [ -n "$pgid" ] && [ "$pgid" != "0" ] && [ "$pgid" != "$own_pgid" ]; then
                 log "Killing process group $pgid"
                 # Send TERM signal to entire process group
                 kill -TERM -"$pgid" 2>/dev/null
@@ -512,20 +555,24 @@ main() {
     # Wait for network if needed (extended timeout for boot scenarios)
     log "Waiting for network connectivity..."
     local network_found=false
-    for i in {1..60}; do
+    local network_timeout=120
+    local next_report=20
+    local start=$SECONDS
+    while [ $((SECONDS - start)) -lt $network_timeout ]; do
         if ping -c 1 -W 2 8.8.8.8 >/dev/null 2>&1 || ping -c 1 -W 2 1.1.1.1 >/dev/null 2>&1; then
-            log "Network is up after $((i*2)) seconds"
+            log "Network is up after $((SECONDS - start)) seconds"
             network_found=true
             break
         fi
-        if [ $((i % 10)) -eq 0 ]; then
-            log "Still waiting for network... ($((i*2))s/120s)"
+        if [ $((SECONDS - start)) -ge $next_report ]; then
+            log "Still waiting for network... ($((SECONDS - start))s/${network_timeout}s)"
+            next_report=$((next_report + 20))
         fi
         sleep 2
     done
 
     if [ "$network_found" = false ]; then
-        log "WARNING: Network not available after 120 seconds, proceeding anyway"
+        log "WARNING: Network not available after ${network_timeout} seconds, proceeding anyway"
     fi
 
     # Add startup delay for system stabilization (important for GUI apps)
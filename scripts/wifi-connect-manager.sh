@@ -8,27 +8,69 @@ CONFIG_FILE="/etc/ossuary/config.json"
 LOG_FILE="/var/log/wifi-connect-manager.log"
 CHECK_INTERVAL=30  # Check every 30 seconds
 MAX_WAIT_FOR_NETWORK=180  # Wait up to 3 minutes for network on boot
-INITIAL_WAIT=15  # Wait 15 seconds before first check to let NetworkManager initialize
+INITIAL_WAIT=15  # Wait up to 15 seconds before first check to let NetworkManager initialize
+SAVED_NETWORKS_TTL=30  # Reuse the saved connection list for 30 seconds
+NETWORK_EVENT_SETTLE=2  # Minimum wait after a NetworkManager event, so bursts can't spin the loops
+
+# Cached names of saved WiFi connections, refreshed by load_saved_networks
+SAVED_NETWORKS=()
+SAVED_NETWORKS_TIME=-1
 
 log() {
-    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a "$LOG_FILE"
+    # printf's %(...)T formats the time in-process instead of forking date/tee
+    local line
+    printf -v line '[%(%Y-%m-%d %H:%M:%S)T] %s' -1 "$1"
+    echo "$line"
+    echo "$line" >> "$LOG_FILE"
 }
 
-# Check if we have a working internet connection
-has_internet() {
-    # Try multiple methods to detect internet connectivity
+# Wait up to $1 seconds, returning early when NetworkManager reports a change
+wait_for_network_event() {
+    local timeout=$1
 
-    # Method 1: Check if we can reach a reliable DNS server
-    if ping -c 1 -W 2 8.8.8.8 >/dev/null 2>&1; then
-        return 0
+    # With NetworkManager down, nmcli monitor prints a "not running" banner
+    # straight away, which would end every wait immediately
+    if ! command -v nmcli >/dev/null ||
+            [ "$(nmcli -t -f RUNNING general 2>/dev/null)" != "running" ]; then
+        sleep "$timeout"
+        return
     fi
 
-    # Method 2: Check if we can reach Cloudflare DNS
-    if ping -c 1 -W 2 1.1.1.1 >/dev/null 2>&1; then
-        return 0
+    local monitor_fd monitor_pid status=0
+    exec {monitor_fd}< <(exec nmcli monitor 2>/dev/null)
+    monitor_pid=$!
+
+    read -r -t "$timeout" -u "$monitor_fd" _ || status=$?
+
+    kill "$monitor_pid" 2>/dev/null
+    exec {monitor_fd}<&-
+
+    # EOF means the monitor could not run at all; fall back to a plain wait.
+    # After a real event, pause briefly so the rest of its burst settles
+    if [ "$status" -eq 1 ]; then
+        sleep "$timeout"
+    elif [ "$status" -eq 0 ]; then
+        sleep $((timeout < NETWORK_EVENT_SETTLE ? timeout : NETWORK_EVENT_SETTLE))
     fi
+}
 
-    # Method 3: Try HTTP connectivity test
+# Check if we have a working internet connection
+has_internet() {
+    # Try multiple methods to detect internet connectivity
+
+    # Method 1: Ping Google and Cloudflare DNS at the same time and take the
+    # first success, so an offline check costs one timeout instead of two
+    local ping_pids=() attempt
+    ping -c 1 -W 2 8.8.8.8 >/dev/null 2>&1 & ping_pids+=($!)
+    ping -c 1 -W 2 1.1.1.1 >/dev/null 2>&1 & ping_pids+=($!)
+    for attempt in 1 2; do
+        if wait -n "${ping_pids[@]}" 2>/dev/null; then
+            kill "${ping_pids[@]}" 2>/dev/null
+            return 0
+        fi
+    done
+
+    # Method 2: Try HTTP connectivity test
     if curl -s --max-time 5 http://detectportal.firefox.com/canonical.html >/dev/null 2>&1; then
         return 0
     fi
@@ -38,13 +80,13 @@ has_internet() {
 
 # Check if we have WiFi connection (not necessarily internet)
 has_wifi_connection() {
-    # Check if any WiFi interface is connected
-    if iwgetid -r >/dev/null 2>&1; then
-        local ssid=$(iwgetid -r)
-        if [ -n "$ssid" ]; then
-            log "Connected to WiFi: $ssid"
-            return 0
-        fi
+    # Check if any WiFi interface is connected (one iwgetid call gives both
+    # the connection state and the SSID)
+    local ssid
+    ssid=$(iwgetid -r 2>/dev/null)
+    if [ -n "$ssid" ]; then
+        log "Connected to WiFi: $ssid"
+        return 0
     fi
 
     # Alternative check using NetworkManager
@@ -59,11 +101,31 @@ has_wifi_connection() {
     return 1
 }
 
+# Load the names of saved WiFi connections into SAVED_NETWORKS
+# The list is only re-read from NetworkManager once the cache expires
+load_saved_networks() {
+    if [ "$SAVED_NETWORKS_TIME" -ge 0 ] && [ $((SECONDS - SAVED_NETWORKS_TIME)) -lt $SAVED_NETWORKS_TTL ]; then
+        return
+    fi
+
+    SAVED_NETWORKS=()
+    if command -v nmcli >/dev/null; then
+        mapfile -t SAVED_NETWORKS < <(nmcli -t -f TYPE,NAME connection show 2>/dev/null | sed -n 's/^802-11-wireless://p')
+    fi
+    SAVED_NETWORKS_TIME=$SECONDS
+}
+
+# Drop the cached saved connection list (e.g. after the portal ran)
+invalidate_saved_networks() {
+    SAVED_NETWORKS_TIME=-1
+}
+
 # Check if there are saved WiFi networks
 has_saved_networks() {
     if command -v nmcli >/dev/null; then
         # List all saved WiFi connections
-        local saved_count=$(nmcli -t -f TYPE,NAME connection show 2>/dev/null | grep -c "^802-11-wireless:")
+        load_saved_networks
+        local saved_count=${#SAVED_NETWORKS[@]}
         if [ "$saved_count" -gt 0 ]; then
             log "Found $saved_count saved WiFi network(s)"
             return 0
@@ -90,24 +152,23 @@ try_connect_saved_networks() {
         nmcli radio wifi on 2>/dev/null || true
         sleep 1
 
-        # Get list of available WiFi networks
-        nmcli device wifi rescan 2>/dev/null || true
-        sleep 3
-
-        # Get list of available SSIDs
-        local available_ssids=$(nmcli -t -f SSID device wifi list 2>/dev/null | sort -u)
+        # Get list of available SSIDs; --rescan yes returns once the scan
+        # has completed instead of guessing how long the driver needs
+        local available_ssids=$(nmcli -t -f SSID device wifi list --rescan yes 2>/dev/null | sort -u)
 
         # Try to connect to each saved network that's available
-        for conn in $(nmcli -t -f TYPE,NAME connection show 2>/dev/null | grep "^802-11-wireless:" | cut -d: -f2); do
+        load_saved_networks
+        for conn in "${SAVED_NETWORKS[@]}"; do
             # Get the SSID for this connection
             local conn_ssid=$(nmcli -t -f 802-11-wireless.ssid connection show "$conn" 2>/dev/null | cut -d: -f2)
 
             # Check if this network is available
             if echo "$available_ssids" | grep -q "^$conn_ssid$"; then
                 log "Attempting to connect to saved network: $conn (SSID: $conn_ssid)"
+                # nmcli blocks until the connection is activated (or fails),
+                # so the state can be checked straight away
                 if nmcli connection up "$conn" 2>/dev/null; then
                     log "Successfully connected to $conn"
-                    sleep 3
                     if has_wifi_connection; then
                         return 0
                     fi
@@ -120,7 +181,6 @@ try_connect_saved_networks() {
         # If no specific connections worked, try auto-connect
         log "Trying NetworkManager auto-connect..."
         nmcli device connect wlan0 2>/dev/null || true
-        sleep 5
 
         if has_wifi_connection; then
             return 0
@@ -134,10 +194,11 @@ try_connect_saved_networks() {
 ensure_autoconnect() {
     if command -v nmcli >/dev/null; then
         # Enable autoconnect for all WiFi connections
-        for conn in $(nmcli -t -f TYPE,NAME connection show 2>/dev/null | grep "^802-11-wireless:" | cut -d: -f2); do
+        load_saved_networks
+        for conn in "${SAVED_NETWORKS[@]}"; do
             log "Enabling autoconnect for network: $conn"
-            nmcli connection modify "$conn" connection.autoconnect yes 2>/dev/null || true
-            nmcli connection modify "$conn" connection.autoconnect-priority 10 2>/dev/null || true
+            # Set both properties in one modify so the profile is committed once
+            nmcli connection modify "$conn" connection.autoconnect yes connection.autoconnect-priority 10 2>/dev/null || true
         done
     fi
 }
@@ -178,15 +239,29 @@ start_wifi_connect() {
 stop_wifi_connect() {
     if wifi_connect_running; then
         log "WiFi connection restored, stopping captive portal..."
+        # systemctl stop only returns once the unit has fully stopped
         systemctl stop wifi-connect
         log "Captive portal stopped"
 
+        # The portal may have saved a new network
+        invalidate_saved_networks
+
         # Give NetworkManager full control back
-        sleep 1
         nmcli device set wlan0 managed yes 2>/dev/null || true
 
+        # wlan0 goes unmanaged -> unavailable -> disconnected; connecting
+        # before it is disconnected fails, so poll for up to a second
+        local tries=0
+        while [ $tries -lt 10 ]; do
+            case "$(nmcli -g GENERAL.STATE device show wlan0 2>/dev/null)" in
+                10\ *|20\ *) ;;
+                *) break ;;
+            esac
+            sleep 0.1
+            tries=$((tries + 1))
+        done
+
         # Trigger a reconnection attempt with saved networks
-        sleep 1
         nmcli device connect wlan0 2>/dev/null || true
     fi
 }
@@ -195,9 +270,14 @@ stop_wifi_connect() {
 wait_for_network_on_boot() {
     local waited=0
 
-    # Initial wait for NetworkManager to fully initialize
-    log "Waiting ${INITIAL_WAIT}s for NetworkManager to initialize..."
-    sleep $INITIAL_WAIT
+    # Initial wait for NetworkManager to fully initialize; nm-online -s
+    # returns as soon as NetworkManager reports its startup is complete
+    log "Waiting up to ${INITIAL_WAIT}s for NetworkManager to initialize..."
+    if command -v nm-online >/dev/null; then
+        nm-online -s -q -t "$INITIAL_WAIT" || true
+    else
+        sleep $INITIAL_WAIT
+    fi
 
     # Check if there are saved networks
     if has_saved_networks; then
@@ -210,6 +290,9 @@ wait_for_network_on_boot() {
         try_connect_saved_networks
 
         # Extended wait time for saved networks
+        local start=$SECONDS
+        local next_retry=60
+        local next_report=30
         while [ $waited -lt $MAX_WAIT_FOR_NETWORK ]; do
             if has_wifi_connection; then
                 log "WiFi connection established after ${waited}s"
@@ -217,16 +300,19 @@ wait_for_network_on_boot() {
             fi
 
             # Periodically try to reconnect
-            if [ $((waited % 60)) -eq 0 ] && [ $waited -gt 0 ]; then
+            if [ $waited -ge $next_retry ]; then
                 log "Retrying connection to saved networks..."
                 try_connect_saved_networks
+                next_retry=$((waited + 60))
             fi
 
-            sleep 5
-            waited=$((waited + 5))
+            # Re-check as soon as NetworkManager reports a state change
+            wait_for_network_event 5
+            waited=$((SECONDS - start))
 
-            if [ $((waited % 30)) -eq 0 ]; then
+            if [ $waited -ge $next_report ]; then
                 log "Still waiting for saved network connection... (${waited}s/${MAX_WAIT_FOR_NETWORK}s)"
+                next_report=$((next_report + 30))
             fi
         done
 
@@ -242,14 +328,15 @@ wait_for_network_on_boot() {
 
         # Short wait in case of temporary network
         local quick_wait=30
+        local start=$SECONDS
         while [ $waited -lt $quick_wait ]; do
             if has_wifi_connection; then
                 log "WiFi connection found after ${waited}s"
                 return 0
             fi
 
-            sleep 5
-            waited=$((waited + 5))
+            wait_for_network_event 5
+            waited=$((SECONDS - start))
         done
 
         log "No saved networks and no connection after ${quick_wait}s"
@@ -261,11 +348,11 @@ wait_for_network_on_boot() {
 # Main monitoring loop
 monitor_network() {
     log "Starting WiFi connection monitoring..."
-    local last_network_check=0
     local network_check_interval=300  # Check saved networks every 5 minutes
+    local last_network_check=$((-network_check_interval))
 
     while true; do
-        local current_time=$(date +%s)
+        local current_time=$SECONDS
 
         if has_wifi_connection; then
             # We have WiFi, make sure captive portal is off
@@ -278,12 +365,14 @@ monitor_network() {
             fi
 
             # Also check if we have internet
+            # Sleep until the interval passes or NetworkManager reports a
+            # change, so a dropped connection is handled immediately
             if has_internet; then
                 # All good, check again later
-                sleep $CHECK_INTERVAL
+                wait_for_network_event $CHECK_INTERVAL
             else
                 log "WiFi connected but no internet, waiting..."
-                sleep $((CHECK_INTERVAL / 2))  # Check more frequently
+                wait_for_network_event $((CHECK_INTERVAL / 2))  # Check more frequently
             fi
         else
             # No WiFi connection detected
@@ -312,10 +401,16 @@ monitor_network() {
                     log "No saved networks found, starting captive portal..."
                 fi
                 start_wifi_connect
-            fi
 
-            # Check more frequently when in AP mode
-            sleep $((CHECK_INTERVAL / 3))
+                # The hotspot comes up after systemctl start returns, and its
+                # own NetworkManager events would end an event wait at once;
+                # give the portal the full interval before checking again
+                sleep $((CHECK_INTERVAL / 3))
+            else
+                # Check more frequently when in AP mode, and straight away
+                # once the portal hands credentials to NetworkManager
+                wait_for_network_event $((CHECK_INTERVAL / 3))
+            fi
         fi
     done
 }